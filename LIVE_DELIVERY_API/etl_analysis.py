@@ -1,10 +1,9 @@
 import os
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
-from supabase import create_client, Client
+import numpy as np
 from dotenv import load_dotenv
 import warnings
+from functools import lru_cache
 
 # --- Configuration ---
 warnings.filterwarnings("ignore") # Clean output
@@ -13,10 +12,28 @@ load_dotenv()
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 PROCESSED_DATA_DIR = "data/processed"
+CATEGORY_COLUMNS = ['city', 'risk_flag']
+
+@lru_cache(maxsize=1)
+def get_supabase_client():
+    from supabase import create_client # Deferred: only needed once data is fetched
+    return create_client(SUPABASE_URL, SUPABASE_KEY)
+
+def group_means(codes, values, n_groups):
+    """
+    Per-group mean of `values` keyed by integer `codes` in 0..n_groups-1.
+    Uses one bincount pass instead of a full groupby; NaN values and
+    negative (missing) codes are skipped, empty groups come back as NaN.
+    """
+    valid = (codes >= 0) & ~np.isnan(values)
+    sums = np.bincount(codes[valid], weights=values[valid], minlength=n_groups)
+    counts = np.bincount(codes[valid], minlength=n_groups)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return sums / counts
 
 def fetch_data():
     print("Fetching data from Supabase...")
-    supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+    supabase = get_supabase_client()
     response = supabase.table("air_quality_data").select("*").execute()
     
     if not response.data:
@@ -27,9 +44,19 @@ def fetch_data():
     df['time'] = pd.to_datetime(df['time'])
     for col in ['pm10', 'pm2_5', 'nitrogen_dioxide', 'ozone', 'severity_score', 'hour']:
         df[col] = pd.to_numeric(df[col], errors='coerce')
+
+    # Categorical labels for the groupby/plot passes below (readings stay
+    # float64 so the trend report prints and exports them unchanged)
+    df[CATEGORY_COLUMNS] = df[CATEGORY_COLUMNS].astype('category')
     return df
 
 def run_analysis():
+    # Plotting libraries are slow to import, so load them only when analysing
+    import matplotlib
+    matplotlib.use('Agg') # Headless backend: plots are only saved to disk
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
     os.makedirs(PROCESSED_DATA_DIR, exist_ok=True)
     df = fetch_data()
     if df is None: return
@@ -37,16 +64,28 @@ def run_analysis():
 
     # 🟩 A. KPI Metrics
     print("\n--- A. KPI Metrics ---")
-    avg_pm25 = df.groupby('city')['pm2_5'].mean()
+    pm25 = df['pm2_5'].to_numpy(dtype=np.float64)
+    cities = df['city'].cat
+    city_codes = cities.codes.to_numpy()
+    avg_pm25 = pd.Series(
+        group_means(city_codes, pm25, len(cities.categories)),
+        index=cities.categories,
+    )
     worst_city = avg_pm25.idxmax()
     worst_val = avg_pm25.max()
     
-    max_sev_idx = df['severity_score'].idxmax()
-    sev_city = df.loc[max_sev_idx, 'city']
-    sev_val = df.loc[max_sev_idx, 'severity_score']
+    # Positional lookup on the raw arrays (NaN scores are skipped, like idxmax)
+    severity = df['severity_score'].to_numpy(dtype=np.float64)
+    max_sev_pos = int(np.nanargmax(severity))
+    # Code -1 means the city is missing; report NaN like df.loc would
+    sev_code = city_codes[max_sev_pos]
+    sev_city = cities.categories[sev_code] if sev_code >= 0 else np.nan
+    sev_val = severity[max_sev_pos]
     
     risk_pct = df['risk_flag'].value_counts(normalize=True) * 100
-    worst_hour = df.groupby('hour')['pm2_5'].mean().idxmax()
+    hours = df['hour'].to_numpy(dtype=np.float64)
+    hour_codes = np.where(np.isnan(hours), -1, hours).astype(np.int64)
+    worst_hour = pd.Series(group_means(hour_codes, pm25, 24)).idxmax()
     
     print(f"1. Highest Avg PM2.5: {worst_city} ({worst_val:.2f})")
     print(f"2. Highest Severity:  {sev_city} ({sev_val:.2f})")
@@ -56,11 +95,13 @@ def run_analysis():
     # 🟩 B. City Pollution Trend Report
     print("\n--- B. City Pollution Trend Report (Preview) ---")
     # Requirement: For each city: time → pm2_5, pm10, ozone
-    trends_df = df[['city', 'time', 'pm2_5', 'pm10', 'ozone']].copy()
+    # Read-only column subset, so no defensive copy is needed
+    trend_columns = ['city', 'time', 'pm2_5', 'pm10', 'ozone']
+    trends_df = df[trend_columns]
     
     # PRINTING IT TO OUTPUT AS REQUESTED
-    print(trends_df.head(10).to_string(index=False)) 
-    print(f"... and {len(trends_df)-10} more rows.")
+    print(df.head(10)[trend_columns].to_string(index=False)) 
+    print(f"... and {len(df)-10} more rows.")
 
     # 🟩 C. Export Outputs
     print("\n--- C. Exporting CSVs ---")
@@ -69,10 +110,10 @@ def run_analysis():
     pd.DataFrame(summary_data).to_csv(f"{PROCESSED_DATA_DIR}/summary_metrics.csv", index=False)
     print("-> summary_metrics.csv saved.")
 
-    df.groupby(['city', 'risk_flag']).size().reset_index(name='count').to_csv(f"{PROCESSED_DATA_DIR}/city_risk_distribution.csv", index=False)
+    df.groupby(['city', 'risk_flag'], sort=False, observed=True).size().reset_index(name='count').to_csv(f"{PROCESSED_DATA_DIR}/city_risk_distribution.csv", index=False)
     print("-> city_risk_distribution.csv saved.")
 
-    trends_df.to_csv(f"{PROCESSED_DATA_DIR}/pollution_trends.csv", index=False)
+    trends_df.to_csv(f"{PROCESSED_DATA_DIR}/pollution_trends.csv", index=False, chunksize=100_000)
     print("-> pollution_trends.csv saved.")
 
     # 🟩 D. Visualizations
@@ -83,25 +124,25 @@ def run_analysis():
     sns.histplot(df['pm2_5'], bins=30, kde=True, color="skyblue")
     plt.title("PM2.5 Histogram")
     plt.savefig(f"{PROCESSED_DATA_DIR}/pm25_histogram.png")
-    plt.show()
+    plt.close()
 
     plt.figure(figsize=(10,6))
     sns.countplot(data=df, x='city', hue='risk_flag', palette="viridis")
     plt.title("Risk Flags per City")
     plt.savefig(f"{PROCESSED_DATA_DIR}/risk_flags_city.png")
-    plt.show()
+    plt.close()
 
     plt.figure(figsize=(12,6))
     sns.lineplot(data=df, x='hour', y='pm2_5', hue='city', marker="o")
     plt.title("Hourly PM2.5 Trends")
     plt.savefig(f"{PROCESSED_DATA_DIR}/hourly_pm25_trends.png")
-    plt.show()
+    plt.close()
 
     plt.figure(figsize=(10,6))
     sns.scatterplot(data=df, x='pm2_5', y='severity_score', hue='risk_flag', palette="deep")
     plt.title("Severity vs PM2.5")
     plt.savefig(f"{PROCESSED_DATA_DIR}/severity_vs_pm25.png")
-    plt.show()
+    plt.close()
     
     print("\n[SUCCESS] Analysis Complete.")
 
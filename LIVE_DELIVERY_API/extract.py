@@ -1,7 +1,10 @@
 import requests
-import json
+from requests.adapters import HTTPAdapter
+import orjson
 import time
 import os
+import glob
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from typing import List, Dict, Any
 
@@ -17,14 +20,49 @@ CITIES = {
 }
 MAX_RETRIES = 3
 RAW_DATA_DIR = "data/raw"
+# Per-city ETags from the last successful fetch (dotfile, so transform's *.json glob skips it)
+ETAGS_FILE = os.path.join(RAW_DATA_DIR, ".etags.json")
+
+# --- Shared HTTP Session ---
+# Reusing pooled keep-alive connections saves a TCP+TLS handshake per request
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(pool_connections=8, pool_maxsize=8, max_retries=0))
+
+# --- Conditional Request Cache ---
+
+def load_etags() -> Dict[str, str]:
+    """
+    Loads the per-city ETags saved by the previous run, if any.
+    """
+    try:
+        with open(ETAGS_FILE, 'rb') as f:
+            return orjson.loads(f.read())
+    except (FileNotFoundError, orjson.JSONDecodeError):
+        return {}
+
+def save_etags(etags: Dict[str, str]) -> None:
+    with open(ETAGS_FILE, 'wb') as f:
+        f.write(orjson.dumps(etags, option=orjson.OPT_INDENT_2))
+
+def latest_raw_file(slug: str) -> str | None:
+    """
+    Returns the most recently written raw file for a city slug, or None.
+    """
+    files = glob.glob(os.path.join(RAW_DATA_DIR, f"{slug}_raw_*.json"))
+    return max(files, key=os.path.getmtime) if files else None
 
 # --- Helper Function for API Call with Retries ---
 
-def fetch_city_data(city_name: str, coords: Dict[str, float]) -> str | None:
+def fetch_city_data(city_name: str, coords: Dict[str, float], etags: Dict[str, str] | None = None) -> str | None:
     """
     Fetches air quality data for a specific city with retry logic.
+    If `etags` holds an ETag for the city, the request is conditional and an
+    unchanged payload (304) reuses the latest cached raw file; new ETags are
+    written back into `etags`.
     Returns the saved file path on success, or None on failure.
     """
+    etags = {} if etags is None else etags
+    slug = city_name.lower().replace(' ', '_')
     
     # 1. Prepare Request Parameters
     params = {
@@ -40,47 +78,48 @@ def fetch_city_data(city_name: str, coords: Dict[str, float]) -> str | None:
         print(f"-> Attempt {attempt} for {city_name}...")
         try:
             # 3. API Request
-            response = requests.get(API_BASE_URL, params=params, timeout=15)
+            headers = {"If-None-Match": etags[city_name]} if city_name in etags else {}
+            response = SESSION.get(API_BASE_URL, params=params, headers=headers, timeout=15)
             response.raise_for_status() # Raises HTTPError for bad responses (4xx or 5xx)
+
+            # Not modified since the last run: reuse the cached payload
+            if response.status_code == 304:
+                cached_path = latest_raw_file(slug)
+                if cached_path:
+                    print(f"   [CACHED] {city_name} unchanged, reusing {cached_path}")
+                    return cached_path
+                # Cached file is gone: drop the ETag and re-fetch unconditionally
+                # within this same attempt
+                print(f"   [WARNING] Cached file for {city_name} is missing. Re-fetching.")
+                etags.pop(city_name, None)
+                response = SESSION.get(API_BASE_URL, params=params, timeout=15)
+                response.raise_for_status()
             
-            raw_data = response.json()
+            raw_data = orjson.loads(response.content)
             
             # 4. Success: Save the raw JSON data
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"{city_name.lower().replace(' ', '_')}_raw_{timestamp}.json"
+            filename = f"{slug}_raw_{timestamp}.json"
             filepath = os.path.join(RAW_DATA_DIR, filename)
             
-            with open(filepath, 'w') as f:
-                json.dump(raw_data, f, indent=4)
+            with open(filepath, 'wb') as f:
+                f.write(orjson.dumps(raw_data, option=orjson.OPT_INDENT_2))
             
+            if response.headers.get("ETag"):
+                etags[city_name] = response.headers["ETag"]
+
             print(f"   [SUCCESS] Data saved to {filepath}")
             return filepath
             
         # 5. Graceful Failure Handling and Logging
-        except requests.exceptions.HTTPError as e:
-            # Server/Client error (e.g., 404, 500)
-            print(f"   [ERROR] HTTP Error for {city_name} on attempt {attempt}: {e}")
+        except requests.exceptions.RequestException as e:
+            # HTTP (4xx/5xx), connection and timeout errors share one retry path
+            print(f"   [ERROR] {type(e).__name__} for {city_name} on attempt {attempt}: {e}")
             if attempt < MAX_RETRIES:
                 time.sleep(2 ** attempt) # Exponential backoff: 2s, 4s
             else:
                 print(f"   [FAILURE] Max retries reached for {city_name}. Skipping.")
                 return None
-        except requests.exceptions.ConnectionError as e:
-            # Network issue (e.g., DNS failure, connection refused)
-            print(f"   [ERROR] Connection Error for {city_name} on attempt {attempt}: {e}")
-            if attempt < MAX_RETRIES:
-                time.sleep(2 ** attempt)
-            else:
-                print(f"   [FAILURE] Max retries reached for {city_name}. Skipping.")
-                return None
-        except requests.exceptions.Timeout as e:
-            # Request timed out
-            print(f"   [ERROR] Timeout Error for {city_name} on attempt {attempt}: {e}")
-            if attempt < MAX_RETRIES:
-                time.sleep(2 ** attempt)
-            else:
-                print(f"   [FAILURE] Max retries reached for {city_name}. Skipping.")
-                return None
         except Exception as e:
             # Any other unexpected error (e.g., JSON decode error, file write error)
             print(f"   [ERROR] An unexpected error occurred for {city_name}: {e}")
@@ -100,12 +139,13 @@ def run_extraction() -> List[str]:
     os.makedirs(RAW_DATA_DIR, exist_ok=True)
     print(f"Starting Air Quality Data Extraction...")
     
-    saved_files = []
-    
-    for city, coords in CITIES.items():
-        filepath = fetch_city_data(city, coords)
-        if filepath:
-            saved_files.append(filepath)
+    # 1. Fetch all cities concurrently (the work is network-bound, so threads
+    #    overlap the request latency instead of paying it once per city)
+    etags = load_etags()
+    with ThreadPoolExecutor(max_workers=len(CITIES)) as executor:
+        results = executor.map(lambda item: fetch_city_data(*item, etags), CITIES.items())
+        saved_files = [filepath for filepath in results if filepath]
+    save_etags(etags)
             
     print("\n--- Extraction Summary ---")
     print(f"Total cities attempted: {len(CITIES)}")
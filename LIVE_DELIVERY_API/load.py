@@ -2,7 +2,8 @@ import os
 import pandas as pd
 import numpy as np
 import time
-from supabase import create_client, Client
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
 # --- Configuration ---
@@ -10,14 +11,26 @@ from dotenv import load_dotenv
 load_dotenv() 
 SUPABASE_URL = os.getenv("SUPABASE_URL", "your_supabase_url_here")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY", "your_supabase_service_role_key_here")
+# Optional: direct Postgres connection string. When set, rows are bulk-loaded
+# with COPY (requires psycopg) instead of JSON batches through PostgREST.
+POSTGRES_URL = os.getenv("POSTGRES_URL")
 
-INPUT_FILE = "data/staged/air_quality_transformed.csv"
+INPUT_FILE = "data/staged/air_quality_transformed.parquet"
 TABLE_NAME = "air_quality_data"
-BATCH_SIZE = 200
+BATCH_SIZE = 1000
 MAX_RETRIES = 2
+MAX_WORKERS = 8
 
 # --- Initialize Supabase Client ---
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+
+@lru_cache(maxsize=1)
+def get_supabase_client():
+    """
+    Creates the Supabase client once and reuses it for every batch.
+    The import is deferred so the COPY path never needs the supabase package.
+    """
+    from supabase import create_client
+    return create_client(SUPABASE_URL, SUPABASE_KEY)
 
 # --- Helper Functions ---
 
@@ -34,22 +47,25 @@ def clean_data_for_json(df):
 
     # 2. Convert datetime objects to string (ISO format)
     # Supabase expects ISO 8601 strings for TIMESTAMP columns
-    df['time'] = pd.to_datetime(df['time']).dt.strftime('%Y-%m-%dT%H:%M:%S')
+    # (Parquet round-trips 'time' as datetime64, so format it in one C pass;
+    # missing timestamps stay None rather than becoming the string 'NaT')
+    times = df['time'].to_numpy(dtype='datetime64[s]')
+    df['time'] = np.where(np.isnat(times), None, np.datetime_as_string(times, unit='s'))
 
     # 3. Handle NaN/Infinity: Replace with None
-    # 'where' replaces values where the condition is False
-    df = df.replace({np.nan: None})
+    # 'where' replaces values where the condition is False (one vectorized mask)
+    df = df.astype(object).where(df.notna(), None)
     
     return df
 
-def insert_batch(batch_data, batch_index):
+def insert_batch(client, batch_data, batch_index):
     """
-    Inserts a single batch of data with retry logic.
+    Inserts a single batch of data with retry logic, using a shared client.
     """
     for attempt in range(MAX_RETRIES + 1):
         try:
             # Convert list of dicts -> Supabase insert
-            response = supabase.table(TABLE_NAME).insert(batch_data).execute()
+            response = client.table(TABLE_NAME).insert(batch_data).execute()
             
             # Check for data in response to confirm success
             if response.data:
@@ -66,8 +82,57 @@ def insert_batch(batch_data, batch_index):
                 print(f"   [Batch {batch_index}] FAILED after {MAX_RETRIES} retries.")
                 return False
 
+def copy_dataframe(df):
+    """
+    Bulk-loads the DataFrame straight into Postgres with COPY, skipping the
+    JSON encode/decode of the PostgREST path. Returns the number of rows copied.
+    """
+    import psycopg # Optional dependency, only needed for the COPY path
+
+    df = df.rename(columns={'risk_label': 'risk_flag'})
+    # NaN/NaT -> None so COPY writes SQL NULL instead of the float 'NaN'
+    rows = df.astype(object).where(df.notna(), None).itertuples(index=False, name=None)
+
+    copy_sql = f"COPY {TABLE_NAME} ({', '.join(df.columns)}) FROM STDIN"
+    with psycopg.connect(POSTGRES_URL) as conn:
+        with conn.cursor() as cur, cur.copy(copy_sql) as copy:
+            for row in rows:
+                copy.write_row(row)
+    return len(df)
+
 # --- Main Load Function ---
 
+def insert_in_batches(df):
+    """
+    Cleans the DataFrame for JSON and inserts it through PostgREST in
+    concurrent batches. Returns (success_count, fail_count).
+    """
+    # 1. Clean Data (NaN handling, Type conversion)
+    df_clean = clean_data_for_json(df)
+    
+    # Convert DataFrame to list of dictionaries (standard JSON format)
+    records = df_clean.to_dict(orient='records')
+    total_records = len(records)
+
+    # 2. Batch Processing
+    # Batches are independent, so keep several requests in flight at once.
+    # The client is created here, before the pool starts: lru_cache does not
+    # lock while create_client runs, so racing workers would each build one.
+    client = get_supabase_client()
+    batches = {
+        (i // BATCH_SIZE) + 1: records[i : i + BATCH_SIZE]
+        for i in range(0, total_records, BATCH_SIZE)
+    }
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        futures = {
+            batch_index: executor.submit(insert_batch, client, batch, batch_index)
+            for batch_index, batch in batches.items()
+        }
+        results = {batch_index: future.result() for batch_index, future in futures.items()}
+
+    success_count = sum(len(batches[idx]) for idx, ok in results.items() if ok)
+    return success_count, total_records - success_count
+
 def run_loading():
     print(f"Starting Data Load to Supabase table: {TABLE_NAME}...")
     
@@ -76,30 +141,23 @@ def run_loading():
         print(f"[ERROR] Input file not found: {INPUT_FILE}")
         return
 
-    df = pd.read_csv(INPUT_FILE)
-    
-    # 2. Clean Data (NaN handling, Type conversion)
-    df_clean = clean_data_for_json(df)
-    
-    # Convert DataFrame to list of dictionaries (standard JSON format)
-    records = df_clean.to_dict(orient='records')
-    total_records = len(records)
-    print(f"Loaded {total_records} records from CSV. Starting batch upload...")
+    df = pd.read_parquet(INPUT_FILE)
+    total_records = len(df)
 
-    # 3. Batch Processing
-    success_count = 0
-    fail_count = 0
-    
-    for i in range(0, total_records, BATCH_SIZE):
-        batch = records[i : i + BATCH_SIZE]
-        batch_index = (i // BATCH_SIZE) + 1
-        
-        if insert_batch(batch, batch_index):
-            success_count += len(batch)
-        else:
-            fail_count += len(batch)
-            
-    # 4. Final Summary
+    # 2. Load via COPY when a direct DB connection is configured, else PostgREST
+    if POSTGRES_URL:
+        print(f"Loaded {total_records} records from Parquet. Starting COPY bulk load...")
+        try:
+            success_count = copy_dataframe(df)
+        except Exception as e:
+            print(f"   [COPY] FAILED: {e}")
+            success_count = 0
+        fail_count = total_records - success_count
+    else:
+        print(f"Loaded {total_records} records from Parquet. Starting batch upload...")
+        success_count, fail_count = insert_in_batches(df)
+
+    # 3. Final Summary
     print("\n--- Load Summary ---")
     print(f"Total Rows Processed: {total_records}")
     print(f"Successfully Inserted: {success_count}")
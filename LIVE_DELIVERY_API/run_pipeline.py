@@ -33,7 +33,7 @@ def main():
         sys.exit(1) # Stop pipeline
 
     # --- STEP 2: TRANSFORM ---
-    print("2️⃣  STEP 2: TRANSFORM (JSON -> CSV)")
+    print("2️⃣  STEP 2: TRANSFORM (JSON -> Parquet)")
     try:
         run_transformation()
         print("   ✅ Transformation Complete.\n")
@@ -1,42 +1,59 @@
 import pandas as pd
+import numpy as np
+import pyarrow as pa
 import os
 import glob
-import json
+import orjson
+from concurrent.futures import ProcessPoolExecutor
 
 # --- Configuration ---
 RAW_DATA_DIR = "data/raw"
 STAGED_DATA_DIR = "data/staged"
-OUTPUT_FILE = os.path.join(STAGED_DATA_DIR, "air_quality_transformed.csv")
+OUTPUT_FILE = os.path.join(STAGED_DATA_DIR, "air_quality_transformed.parquet")
+
+# Category bins are right-inclusive:
+# PM2.5 <= 50 Good, <= 100 Moderate, <= 200 Unhealthy, <= 300 Very Unhealthy, else Hazardous
+AQI_BINS = [-np.inf, 50, 100, 200, 300, np.inf]
+AQI_LABELS = ["Good", "Moderate", "Unhealthy", "Very Unhealthy", "Hazardous"]
+
+# Severity <= 200 Low Risk, <= 400 Moderate Risk, else High Risk
+RISK_BINS = [-np.inf, 200, 400, np.inf]
+RISK_LABELS = ["Low Risk", "Moderate Risk", "High Risk"]
+
+POLLUTANTS = ['pm10', 'pm2_5', 'carbon_monoxide', 'nitrogen_dioxide', 'ozone', 'sulphur_dioxide', 'uv_index']
+FINAL_COLUMNS = [
+    'city', 'time', 'hour', 
+    'pm10', 'pm2_5', 'nitrogen_dioxide', 'sulphur_dioxide', 'ozone', 'carbon_monoxide', 'uv_index',
+    'aqi_category', 'severity_score', 'risk_label'
+]
+
+# Pollutant weights for the severity score
+SEVERITY_WEIGHTS = {
+    'pm2_5': 5,
+    'pm10': 3,
+    'nitrogen_dioxide': 4,
+    'sulphur_dioxide': 4,
+    'carbon_monoxide': 2,
+    'ozone': 3,
+}
 
 # --- Helper Functions ---
 
-def get_aqi_category(pm2_5):
-    """
-    Determines AQI Category based on PM2.5 levels.
+def categorize(values, bins, labels):
     """
-    if pd.isna(pm2_5): return "Unknown"
-    if pm2_5 <= 50: return "Good"
-    elif pm2_5 <= 100: return "Moderate"
-    elif pm2_5 <= 200: return "Unhealthy"
-    elif pm2_5 <= 300: return "Very Unhealthy"
-    else: return "Hazardous"
-
-def get_risk_label(severity):
+    Buckets a numeric ndarray into labels in a single vectorized pass.
+    Missing values are labelled "Unknown".
     """
-    Determines Risk Label based on Severity Score.
-    """
-    if pd.isna(severity): return "Unknown"
-    if severity > 400: return "High Risk"
-    elif severity > 200: return "Moderate Risk"
-    else: return "Low Risk"
+    codes = np.searchsorted(bins[1:-1], values, side='left')
+    return np.where(np.isnan(values), "Unknown", np.asarray(labels, dtype=object)[codes])
 
 def process_city_file(filepath):
     """
-    Reads a raw JSON file and converts it into a Pandas DataFrame.
+    Reads a raw JSON file and converts it into an Arrow table.
     """
     try:
-        with open(filepath, 'r') as f:
-            data = json.load(f)
+        with open(filepath, 'rb') as f:
+            data = orjson.loads(f.read())
         
         # 1. Flatten Hourly Data
         # Open-Meteo returns data in a structure like: {"hourly": {"time": [...], "pm10": [...]}}
@@ -46,20 +63,64 @@ def process_city_file(filepath):
             print(f"[WARNING] No hourly data found in {filepath}")
             return None
 
-        df = pd.DataFrame(hourly_data)
-        
         # 2. Extract City Name from Filename
         # Filename format: delhi_raw_2023...json -> extract "delhi"
         filename = os.path.basename(filepath)
         city_name = filename.split('_raw_')[0].replace('_', ' ').title()
-        df['city'] = city_name
         
-        return df
+        return pa.Table.from_pydict({**hourly_data, 'city': [city_name] * len(hourly_data['time'])})
         
     except Exception as e:
         print(f"[ERROR] Failed to process {filepath}: {e}")
         return None
 
+def transform_frame(df):
+    """
+    Cleans the merged raw DataFrame and adds the engineered features.
+    Returns the DataFrame with columns in output order.
+    """
+    # 1. Basic Transformations
+    # Convert time to datetime objects
+    df['time'] = pd.to_datetime(df['time'])
+    
+    # Ensure all pollutant columns are numeric (coercing errors to NaN);
+    # a reading the API did not return becomes an all-NaN column
+    for col in POLLUTANTS:
+        if col not in df.columns:
+            df[col] = np.nan
+        df[col] = pd.to_numeric(df[col], errors='coerce')
+
+    df['city'] = df['city'].astype('category')
+
+    # Remove rows where ALL pollutant readings are missing
+    df.dropna(subset=POLLUTANTS, how='all', inplace=True)
+
+    # 2. Feature Engineering
+    
+    # A. Hour of Day
+    df['hour'] = df['time'].dt.hour
+    
+    # B. AQI Category (Vectorized binning)
+    pm2_5 = df['pm2_5'].to_numpy()
+    df['aqi_category'] = categorize(pm2_5, AQI_BINS, AQI_LABELS)
+    
+    # C. Pollution Severity Score (accumulated in place over column views)
+    # severity = (pm2_5 * 5) + (pm10 * 3) + (no2 * 4) + (so2 * 4) + (co * 2) + (o3 * 3)
+    # Summed in the formula's left-to-right order, so scores match the plain
+    # expression exactly
+    readings = [df[col].to_numpy() for col in SEVERITY_WEIGHTS]
+    weights = list(SEVERITY_WEIGHTS.values())
+    severity = np.multiply(readings[0], weights[0], dtype=np.float64)
+    for column, weight in zip(readings[1:], weights[1:]):
+        severity += column * weight
+    df['severity_score'] = severity
+    
+    # D. Risk Classification
+    df['risk_label'] = categorize(severity, RISK_BINS, RISK_LABELS)
+
+    # 3. Reorder Columns for Clean Output
+    return df[FINAL_COLUMNS]
+
 # --- Main Transformation Function ---
 
 def run_transformation():
@@ -75,64 +136,28 @@ def run_transformation():
         print("[ERROR] No JSON files found in data/raw/. Please run extract.py first.")
         return
 
-    data_frames = []
-    for filepath in json_files:
-        df = process_city_file(filepath)
-        if df is not None:
-            data_frames.append(df)
+    # Each file is independent, so parse them in parallel across CPU cores
+    chunksize = max(1, len(json_files) // (2 * (os.cpu_count() or 1)))
+    with ProcessPoolExecutor() as executor:
+        tables = [
+            table for table in executor.map(process_city_file, json_files, chunksize=chunksize)
+            if table is not None
+        ]
     
-    if not data_frames:
+    if not tables:
         print("[ERROR] No valid data extracted.")
         return
 
-    # Concatenate all city data into one DataFrame
-    full_df = pd.concat(data_frames, ignore_index=True)
-    
-    # 2. Basic Transformations
-    # Convert time to datetime objects
-    full_df['time'] = pd.to_datetime(full_df['time'])
-    
-    # Ensure all pollutant columns are numeric (coercing errors to NaN)
-    pollutants = ['pm10', 'pm2_5', 'carbon_monoxide', 'nitrogen_dioxide', 'ozone', 'sulphur_dioxide', 'uv_index']
-    for col in pollutants:
-        full_df[col] = pd.to_numeric(full_df[col], errors='coerce')
+    # Concatenate all city data (zero-copy chunked Arrow table; missing
+    # columns are null-filled and mixed int/float readings widen to double,
+    # as pd.concat did) and convert to a DataFrame once
+    full_df = pa.concat_tables(tables, promote_options="permissive").to_pandas(self_destruct=True)
 
-    # Remove rows where ALL pollutant readings are missing
-    full_df.dropna(subset=pollutants, how='all', inplace=True)
+    # 2. Clean and Engineer Features
+    final_df = transform_frame(full_df)
 
-    # 3. Feature Engineering
-    
-    # A. Hour of Day
-    full_df['hour'] = full_df['time'].dt.hour
-    
-    # B. AQI Category (Apply function row-wise)
-    full_df['aqi_category'] = full_df['pm2_5'].apply(get_aqi_category)
-    
-    # C. Pollution Severity Score (Vectorized calculation)
-    # severity = (pm2_5 * 5) + (pm10 * 3) + (no2 * 4) + (so2 * 4) + (co * 2) + (o3 * 3)
-    full_df['severity_score'] = (
-        (full_df['pm2_5'] * 5) +
-        (full_df['pm10'] * 3) +
-        (full_df['nitrogen_dioxide'] * 4) +
-        (full_df['sulphur_dioxide'] * 4) +
-        (full_df['carbon_monoxide'] * 2) +
-        (full_df['ozone'] * 3)
-    )
-    
-    # D. Risk Classification
-    full_df['risk_label'] = full_df['severity_score'].apply(get_risk_label)
-
-    # 4. Reorder Columns for Clean Output
-    final_columns = [
-        'city', 'time', 'hour', 
-        'pm10', 'pm2_5', 'nitrogen_dioxide', 'sulphur_dioxide', 'ozone', 'carbon_monoxide', 'uv_index',
-        'aqi_category', 'severity_score', 'risk_label'
-    ]
-    # Filter only columns that exist (in case API changes) and are in our list
-    final_df = full_df[[c for c in final_columns if c in full_df.columns]]
-
-    # 5. Save to CSV
-    final_df.to_csv(OUTPUT_FILE, index=False)
+    # 3. Save to Parquet (typed, columnar, compressed; keeps the categorical city dtype)
+    final_df.to_parquet(OUTPUT_FILE, engine='pyarrow', compression='snappy', index=False)
     
     print("\n--- Transformation Summary ---")
     print(f"Total records processed: {len(final_df)}")